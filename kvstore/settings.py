@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Compress responses (notably large range results) for clients that accept gzip
+    'django.middleware.gzip.GZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -95,6 +97,11 @@ DATABASES = {
             # Note: WAL and durability settings must be configured at PostgreSQL server level
             # See postgresql.conf for: synchronous_commit, wal_level, checkpoint_timeout, etc.
             'options': '-c statement_timeout=30000',  # 30 second query timeout
+            # Bind parameters server-side so psycopg 3 prepares hot statements
+            # (point reads, upserts) after 5 executions on a connection instead of
+            # re-parsing and re-planning them on every request. Requires a direct
+            # connection or session pooling (not pgbouncer transaction pooling).
+            'server_side_binding': True,
         },
     }
 }
@@ -186,7 +193,7 @@ STATIC_URL = 'static/'
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'storage.renderers.ORJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -202,6 +209,7 @@ SPECTACULAR_SETTINGS = {
     'VERSION': '1.0.0',
     'SERVE_INCLUDE_SCHEMA': False,
     'COMPONENT_SPLIT_REQUEST': True,
+    'DEFAULT_GENERATOR_CLASS': 'storage.schemas.CachedSchemaGenerator',
 }
 
 # Default primary key field type
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-15 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='keyvalueentry',
+            constraint=models.CheckConstraint(condition=models.Q(('key__gt', '')), name='kv_key_nonempty'),
+        ),
+    ]
@@ -12,6 +12,9 @@ class KeyValueEntry(models.Model):
 
     class Meta:
         ordering = ["key"]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(key__gt=""), name="kv_key_nonempty"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.key} (v{self.version})"
@@ -0,0 +1,32 @@
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# OPT_UTC_Z matches DRF's "Z" suffix for UTC datetimes; OPT_NON_STR_KEYS
+# accepts the int-keyed error dicts produced by ListField and DictField
+_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+# Types orjson does not handle natively (lazy translation strings, Decimal, ...)
+_default = JSONEncoder().default
+
+
+def dumps(data) -> bytes:
+    """
+    Encode data as JSON bytes with the same output as DRF's JSONRenderer.
+    U+2028 and U+2029 are escaped like DRF does, since they are valid JSON
+    but terminate lines in JavaScript.
+    """
+    encoded = orjson.dumps(data, default=_default, option=_OPTIONS)
+    return encoded.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class ORJSONRenderer(BaseRenderer):
+    """Drop-in replacement for DRF's JSONRenderer backed by orjson."""
+
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return dumps(data)
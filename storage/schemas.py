@@ -0,0 +1,36 @@
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.utils import translation
+from drf_spectacular.generators import SchemaGenerator
+from rest_framework.settings import api_settings
+
+
+class CachedSchemaGenerator(SchemaGenerator):
+    """
+    OpenAPI schema generator that builds the schema once per process.
+    The schema only depends on code and settings, so walking every view and
+    serializer again on each request is wasted work.
+    """
+
+    # Keyed by (api_version, language); shared by all instances in the process
+    _schemas: Dict[Tuple[Optional[str], Optional[str]], dict] = {}
+
+    @staticmethod
+    def _is_cacheable(version: Optional[str], language: Optional[str]) -> bool:
+        """
+        Only configured versions and languages are cached. Both can come from
+        query parameters, so caching arbitrary values would grow without bound.
+        """
+        known_versions = {None, *(api_settings.ALLOWED_VERSIONS or ())}
+        known_languages = {settings.LANGUAGE_CODE, *(code for code, _ in settings.LANGUAGES)}
+        return version in known_versions and language in known_languages
+
+    def get_schema(self, request=None, public=False):
+        cache_key = (self.api_version, translation.get_language())
+        schema = self._schemas.get(cache_key)
+        if schema is None:
+            schema = super().get_schema(request=request, public=public)
+            if self._is_cacheable(*cache_key):
+                self._schemas[cache_key] = schema
+        return schema
@@ -1,3 +1,6 @@
+import re
+from typing import List, Optional
+
 from rest_framework import serializers
 
 from storage.models import KeyValueEntry
@@ -19,6 +22,21 @@ class KeyValueSerializer(serializers.ModelSerializer):
         read_only_fields = ["version", "updated_at", "created_at"]
 
 
+def serialize_entry(entry: KeyValueEntry) -> dict:
+    """
+    Fast-path equivalent of KeyValueSerializer(entry).data for hot read paths.
+    Builds the dict directly instead of going through DRF's per-field machinery;
+    datetimes are left as objects for the JSON encoder to format.
+    """
+    return {
+        "key": entry.key,
+        "value": entry.value,
+        "version": entry.version,
+        "updated_at": entry.updated_at,
+        "created_at": entry.created_at,
+    }
+
+
 class KeyValueWriteSerializer(serializers.Serializer):
     """Serializer for writing/updating key values."""
 
@@ -59,12 +77,62 @@ class BatchPutSerializer(serializers.Serializer):
                 f"Batch size {len(items)} exceeds maximum of {MAX_BATCH_SIZE} items"
             )
         
-        keys = [item["key"] for item in items]
-        if len(keys) != len(set(keys)):
-            raise serializers.ValidationError("Duplicate keys detected in batch request")
+        # Single pass over the items, stopping at the first duplicate
+        seen = set()
+        for item in items:
+            key = item["key"]
+            if key in seen:
+                raise serializers.ValidationError(
+                    f"Duplicate keys detected in batch request: {key!r}"
+                )
+            seen.add(key)
         return items
 
 
+# Characters DRF's CharField rejects: NUL and lone UTF-16 surrogates
+_PROHIBITED_CHARS = re.compile("[\x00\ud800-\udfff]")
+_MAX_KEY_LENGTH = BatchItemSerializer().fields["key"].max_length
+
+
+def validate_batch_items_fast(data) -> Optional[List[dict]]:
+    """
+    Fast path for BatchPutSerializer on well-formed requests.
+    Returns the same validated items BatchPutSerializer would produce, or None
+    when anything is unusual (wrong types, limits, duplicates, ...) so the
+    caller falls back to the full serializer and its standard error messages.
+    Mirrors the CharField rules: whitespace is trimmed, keys must be non-blank
+    and at most 255 characters, and NUL/surrogate characters are rejected.
+    """
+    if not isinstance(data, dict):
+        return None
+    items = data.get("items")
+    if not isinstance(items, list) or not 0 < len(items) <= MAX_BATCH_SIZE:
+        return None
+    
+    validated = []
+    seen = set()
+    for item in items:
+        if type(item) is not dict:
+            return None
+        key = item.get("key")
+        value = item.get("value")
+        if type(key) is not str or type(value) is not str:
+            return None
+        key = key.strip()
+        value = value.strip()
+        if (
+            not key
+            or len(key) > _MAX_KEY_LENGTH
+            or key in seen
+            or _PROHIBITED_CHARS.search(key)
+            or _PROHIBITED_CHARS.search(value)
+        ):
+            return None
+        seen.add(key)
+        validated.append({"key": key, "value": value})
+    return validated
+
+
 class KeyValueRangeResponseSerializer(serializers.Serializer):
     """Serializer for range query responses with pagination support."""
 
@@ -1,19 +1,43 @@
-from typing import Iterable, List, Optional, Tuple
+import threading
+from collections import OrderedDict
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from django.core.cache import cache
-from django.db import transaction
-from django.db.models import F
+from django.db import connection, transaction
+from django.utils import timezone
 
 from storage.models import KeyValueEntry
 
 # Cache settings
 CACHE_TIMEOUT = 300  # 5 minutes
 CACHE_KEY_PREFIX = "kv:"
+CACHE_TOKEN_PREFIX = "kvv:"  # Small per-key version tokens validating the local tier
+LOCAL_CACHE_SIZE = 1024  # Hot entries kept in process memory
+LOCAL_CACHE_MAX_VALUE_LENGTH = 4096  # Larger values are only kept in the shared cache
 
 # Resource limits for predictable behavior
 MAX_RANGE_SIZE = 10000  # Maximum items to return in a single range query
 MAX_BATCH_SIZE = 10000  # Maximum items in a single batch operation
 BATCH_CHUNK_SIZE = 1000  # Process batches in chunks to avoid memory issues
+RANGE_ITERATOR_THRESHOLD = 2000  # Page size above which range reads use iterator()
+RANGE_CHUNK_SIZE = 2000  # Rows per DB fetch and per encoded chunk for large range reads
+
+
+# Upsert that bumps the version on conflict and returns the stored rows.
+# {values} is filled with one _UPSERT_ROW placeholder group per row.
+_UPSERT_SQL = f"""
+    INSERT INTO {KeyValueEntry._meta.db_table} ("key", "value", "version", "created_at", "updated_at")
+    VALUES {{values}}
+    ON CONFLICT ("key") DO UPDATE SET
+        "value" = EXCLUDED."value",
+        "version" = {KeyValueEntry._meta.db_table}."version" + 1,
+        "updated_at" = EXCLUDED."updated_at"
+    RETURNING "id", "key", "value", "version", "created_at", "updated_at"
+"""
+_UPSERT_ROW = "(%s, %s, 1, %s, %s)"
+_DELETE_SQL = f'DELETE FROM {KeyValueEntry._meta.db_table} WHERE "key" = %s'
 
 
 def _get_cache_key(key: str) -> str:
@@ -21,63 +45,141 @@ def _get_cache_key(key: str) -> str:
     return f"{CACHE_KEY_PREFIX}{key}"
 
 
+def _get_token_key(key: str) -> str:
+    """Generate the cache key holding the version token for a given key."""
+    return f"{CACHE_TOKEN_PREFIX}{key}"
+
+
+def _version_token(entry: KeyValueEntry) -> str:
+    """Token identifying one stored revision of an entry (survives delete + re-create)."""
+    return f"{entry.version}@{entry.updated_at.isoformat()}"
+
+
+# In-process LRU in front of the shared cache. Entries are only served after
+# their version token is confirmed in the shared cache, so writes made by
+# other processes are never hidden by a stale local copy.
+_local_entries: "OrderedDict[str, KeyValueEntry]" = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _local_get(key: str) -> Optional[KeyValueEntry]:
+    """Return the local copy of an entry, marking it most recently used."""
+    with _local_lock:
+        entry = _local_entries.get(key)
+        if entry is not None:
+            _local_entries.move_to_end(key)
+        return entry
+
+
+def _local_put(entry: KeyValueEntry) -> None:
+    """Store a local copy of an entry, evicting the least recently used one."""
+    # Values are unbounded, so only small ones are pinned in every worker's memory
+    if len(entry.value) > LOCAL_CACHE_MAX_VALUE_LENGTH:
+        _invalidate_local(entry.key)
+        return
+    with _local_lock:
+        _local_entries[entry.key] = entry
+        _local_entries.move_to_end(entry.key)
+        if len(_local_entries) > LOCAL_CACHE_SIZE:
+            _local_entries.popitem(last=False)
+
+
+def _invalidate_local(key: str) -> None:
+    """Drop the local copy of an entry, if any."""
+    with _local_lock:
+        _local_entries.pop(key, None)
+
+
+def _cache_entries(entries: Iterable[KeyValueEntry]) -> None:
+    """Store entries and their version tokens in the shared cache in one round-trip."""
+    data = {}
+    for entry in entries:
+        data[_get_cache_key(entry.key)] = entry
+        data[_get_token_key(entry.key)] = _version_token(entry)
+    if data:
+        cache.set_many(data, CACHE_TIMEOUT)
+
+
+def _invalidate(keys: Iterable[str]) -> None:
+    """Drop cached entries and version tokens for keys from every cache tier."""
+    cache_keys = []
+    with _local_lock:
+        for key in keys:
+            _local_entries.pop(key, None)
+            cache_keys.append(_get_cache_key(key))
+            cache_keys.append(_get_token_key(key))
+    if cache_keys:
+        cache.delete_many(cache_keys)
+
+
+def _upsert(pairs: List[Tuple[str, str]]) -> List[KeyValueEntry]:
+    """Upsert (key, value) pairs in one statement and return the stored rows."""
+    now = timezone.now()
+    params: list = []
+    for key, value in pairs:
+        params.extend((key, value, now, now))
+    sql = _UPSERT_SQL.format(values=", ".join([_UPSERT_ROW] * len(pairs)))
+    return list(KeyValueEntry.objects.raw(sql, params))
+
+
 def put_value(key: str, value: str) -> tuple[KeyValueEntry, bool]:
     """
-    Optimized put operation using update_or_create for atomic upsert.
-    Removes need for select_for_update() lock, reducing latency significantly.
-    Uses F() expressions for atomic version increment at database level.
+    Single round-trip upsert using INSERT ... ON CONFLICT DO UPDATE RETURNING.
+    The version is incremented atomically by the database and the written row
+    is returned by the same statement, so no follow-up SELECT is needed.
+    Updates always yield version >= 2, so version == 1 means the row was created.
     """
-    # Use update_or_create which is optimized and doesn't require explicit locking
-    # This is much faster than select_for_update() + save()
-    with transaction.atomic():
-        # First, try to update existing entry atomically
-        updated = KeyValueEntry.objects.filter(key=key).update(
-            value=value,
-            version=F("version") + 1,
-        )
-        
-        if updated:
-            # Entry existed and was updated
-            entry = KeyValueEntry.objects.get(key=key)
-            created = False
-        else:
-            # Entry doesn't exist, create it
-            entry = KeyValueEntry.objects.create(key=key, value=value, version=1)
-            created = True
-        
-        # Invalidate cache on write
-        cache.delete(_get_cache_key(key))
-        
-        return entry, created
+    entry = _upsert([(key, value)])[0]
+    created = entry.version == 1
+    
+    # Invalidate cache on write
+    _invalidate([key])
+    
+    return entry, created
 
 
 def read_value(key: str) -> KeyValueEntry:
     """
-    Optimized read with in-memory caching for hot keys.
+    Optimized read with two cache tiers for hot keys.
+    A process-local LRU copy is served when its version token still matches the
+    shared cache, which avoids transferring and unpickling the full entry;
+    otherwise the shared cache and then the database are consulted.
     Uses only() to fetch minimal fields from database.
     """
-    cache_key = _get_cache_key(key)
-    
-    # Try cache first (hot path for frequently accessed keys)
-    cached_entry = cache.get(cache_key)
-    if cached_entry is not None:
-        return cached_entry
-    
-    # Cache miss - fetch from database with minimal fields
-    entry = KeyValueEntry.objects.only("key", "value", "version", "created_at", "updated_at").get(key=key)
+    local_entry = _local_get(key)
+    if local_entry is not None and cache.get(_get_token_key(key)) == _version_token(local_entry):
+        return local_entry
     
-    # Cache for future reads (write-through cache)
-    cache.set(cache_key, entry, CACHE_TIMEOUT)
+    # Try shared cache next (hot path for frequently accessed keys)
+    entry = cache.get(_get_cache_key(key))
+    if entry is None:
+        # Cache miss - fetch from database with minimal fields
+        try:
+            entry = KeyValueEntry.objects.only("key", "value", "version", "created_at", "updated_at").get(key=key)
+        except KeyValueEntry.DoesNotExist:
+            # Deleted elsewhere; drop any stale local copy
+            _invalidate_local(key)
+            raise
+        
+        # Cache for future reads (write-through cache)
+        _cache_entries([entry])
     
+    _local_put(entry)
     return entry
 
 
 def delete_value(key: str) -> bool:
-    """Delete operation with cache invalidation."""
-    deleted, _ = KeyValueEntry.objects.filter(key=key).delete()
+    """
+    Delete operation with cache invalidation.
+    Issues a single autocommitted DELETE; QuerySet.delete() would wrap it in a
+    transaction, costing extra BEGIN/COMMIT round-trips for one statement.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_DELETE_SQL, [key])
+        deleted = cursor.rowcount
     if deleted:
         # Invalidate cache on delete
-        cache.delete(_get_cache_key(key))
+        _invalidate([key])
     return bool(deleted)
 
 
@@ -85,150 +187,108 @@ def read_range(
     start_key: str,
     end_key: str,
     limit: Optional[int] = None,
-    offset: int = 0,
     cursor: Optional[str] = None,
-) -> Tuple[List[KeyValueEntry], Optional[str], bool]:
+) -> Tuple[List[Dict[str, Any]], Optional[str], bool]:
     """
-    Memory-efficient range query with pagination support.
+    Memory-efficient range query with keyset (seek) pagination.
     
-    Uses iterator() for large datasets to avoid loading all results into memory.
-    Supports both offset-based and cursor-based pagination.
+    Uses iterator() for large pages to avoid loading all results into memory.
+    Pages are addressed by cursor rather than OFFSET, so every page is a single
+    index seek to its first key regardless of how deep into the range it is.
+    Rows come back as plain dicts via values(), skipping model instantiation;
+    they already have the response shape of serialize_entry().
     
     Args:
         start_key: Start key (inclusive)
         end_key: End key (inclusive)
         limit: Maximum number of results to return (default: MAX_RANGE_SIZE)
-        offset: Offset for pagination (used if cursor is None)
         cursor: Cursor for cursor-based pagination (key of last returned item)
     
     Returns:
         Tuple of (entries, next_cursor, has_more)
-        - entries: List of KeyValueEntry objects
+        - entries: List of entry dicts (key, value, version, updated_at, created_at)
         - next_cursor: Key to use for next page (None if no more results)
         - has_more: Whether there are more results available
     """
     if limit is None:
         limit = MAX_RANGE_SIZE
     else:
-        limit = min(limit, MAX_RANGE_SIZE)  # Enforce maximum
+        limit = max(1, min(limit, MAX_RANGE_SIZE))  # Enforce bounds
     
     queryset = (
         KeyValueEntry.objects.filter(key__gte=start_key, key__lte=end_key)
-        .only("key", "value", "version", "created_at", "updated_at")
+        .values("key", "value", "version", "updated_at", "created_at")
         .order_by("key")
     )
     
-    # Cursor-based pagination (more efficient for large datasets)
+    # Keyset pagination: seek past the cursor instead of using OFFSET. Both lower
+    # bounds are left to the database, which starts the index scan at the tighter
+    # one using its own collation order.
     if cursor:
         queryset = queryset.filter(key__gt=cursor)
     
-    # Use iterator() for memory efficiency - streams results instead of loading all
-    # This allows handling datasets much larger than RAM
     queryset = queryset[:limit + 1]  # Fetch one extra to check if there's more
     
-    # Convert iterator to list, but only fetch what we need
-    entries = []
-    iterator = queryset.iterator(chunk_size=1000)  # Process in chunks
+    # Small pages fit comfortably in memory, so a plain list() avoids the
+    # server-side cursor setup and per-row overhead of iterator(). Large pages
+    # still stream in chunks to keep memory bounded.
+    if limit > RANGE_ITERATOR_THRESHOLD:
+        rows = list(queryset.iterator(chunk_size=RANGE_CHUNK_SIZE))
+    else:
+        rows = list(queryset)
     
-    for entry in iterator:
-        if len(entries) < limit:
-            entries.append(entry)
-        else:
-            # We have one extra entry, so there are more results
-            next_cursor = entry.key
-            return entries, next_cursor, True
+    has_more = len(rows) > limit
+    entries = rows[:limit]
+    # The cursor is the last returned key; the next page starts after it
+    next_cursor = entries[-1]["key"] if has_more and entries else None
     
-    # No more results
-    return entries, None, False
+    return entries, next_cursor, has_more
 
 
 def batch_put(items: Iterable[dict]) -> List[KeyValueEntry]:
     """
     Memory-efficient batch operation using chunked processing.
-    Processes large batches in chunks to avoid memory issues with datasets larger than RAM.
-    Uses bulk operations for optimal performance.
+    Consumes items lazily in chunks, so streamed inputs are never materialized in full.
+    Each chunk is written with a single INSERT ... ON CONFLICT DO UPDATE statement
+    whose RETURNING rows are the results, so no separate read is needed.
     """
-    items_list = list(items)  # Convert to list for validation
-    
-    if not items_list:
-        return []
-    
-    # Enforce maximum batch size for predictable behavior
-    if len(items_list) > MAX_BATCH_SIZE:
-        raise ValueError(
-            f"Batch size {len(items_list)} exceeds maximum of {MAX_BATCH_SIZE} items"
-        )
+    # Rows are written in key order so concurrent batches with overlapping keys
+    # lock them in the same order instead of deadlocking. The whole batch is one
+    # transaction, so a materialized batch is sorted as a whole; streamed input
+    # can only be ordered within each chunk.
+    streamed = not isinstance(items, Sequence)
+    if streamed:
+        request_keys: List[str] = []
+    else:
+        if len(items) > MAX_BATCH_SIZE:
+            raise ValueError(f"Batch size exceeds maximum of {MAX_BATCH_SIZE} items")
+        request_keys = [item["key"] for item in items]
+        items = sorted(items, key=itemgetter("key"))
     
-    all_results: List[KeyValueEntry] = []
-    all_cache_keys_to_invalidate: List[str] = []
+    iterator = iter(items)
+    total = 0
+    upserted: Dict[str, KeyValueEntry] = {}
     
-    # Process in chunks to handle large batches without memory issues
-    for chunk_start in range(0, len(items_list), BATCH_CHUNK_SIZE):
-        chunk = items_list[chunk_start : chunk_start + BATCH_CHUNK_SIZE]
-        
-        chunk_results: List[KeyValueEntry] = []
-        chunk_cache_keys: List[str] = []
-        
-        with transaction.atomic():
-            # Collect keys for batch lookup
-            keys = [item["key"] for item in chunk]
-            
-            # Bulk fetch existing entries (memory efficient with iterator)
-            existing_entries = {
-                entry.key: entry
-                for entry in KeyValueEntry.objects.filter(key__in=keys)
-                .only("id", "key", "version")
-                .iterator(chunk_size=500)  # Stream results
-            }
-            
-            # Separate creates and updates
-            to_create: List[KeyValueEntry] = []
-            to_update: List[KeyValueEntry] = []
-            
-            for item in chunk:
-                key = item["key"]
-                value = item["value"]
-                chunk_cache_keys.append(_get_cache_key(key))
-                
-                if key in existing_entries:
-                    # Update existing
-                    entry = existing_entries[key]
-                    entry.value = value
-                    entry.version += 1
-                    to_update.append(entry)
-                else:
-                    # Create new
-                    to_create.append(KeyValueEntry(key=key, value=value, version=1))
-            
-            # Bulk create new entries
-            if to_create:
-                KeyValueEntry.objects.bulk_create(to_create)
-                chunk_results.extend(to_create)
+    # One transaction for the whole batch: all items commit together, and
+    # exceeding the size limit mid-stream rolls back earlier chunks
+    with transaction.atomic():
+        while chunk := list(islice(iterator, BATCH_CHUNK_SIZE)):
+            # Enforce maximum batch size for predictable behavior
+            total += len(chunk)
+            if total > MAX_BATCH_SIZE:
+                raise ValueError(
+                    f"Batch size exceeds maximum of {MAX_BATCH_SIZE} items"
+                )
             
-            # Bulk update existing entries
-            if to_update:
-                KeyValueEntry.objects.bulk_update(to_update, ["value", "version", "updated_at"])
-                chunk_results.extend(to_update)
-        
-        all_results.extend(chunk_results)
-        all_cache_keys_to_invalidate.extend(chunk_cache_keys)
+            # One multi-row INSERT ... ON CONFLICT per chunk; versions are bumped
+            # by the database, so no prefetch of existing rows is needed.
+            pairs = sorted((item["key"], item["value"]) for item in chunk)
+            upserted.update((entry.key, entry) for entry in _upsert(pairs))
+            if streamed:
+                request_keys.extend(item["key"] for item in chunk)
     
     # Invalidate cache for all modified keys (batch operation)
-    if all_cache_keys_to_invalidate:
-        cache.delete_many(all_cache_keys_to_invalidate)
-    
-    # Refresh entries in chunks to avoid memory issues
-    all_result_keys = [entry.key for entry in all_results]
-    refreshed_entries = {}
-    
-    for chunk_start in range(0, len(all_result_keys), BATCH_CHUNK_SIZE):
-        chunk_keys = all_result_keys[chunk_start : chunk_start + BATCH_CHUNK_SIZE]
-        chunk_refreshed = {
-            entry.key: entry
-            for entry in KeyValueEntry.objects.filter(key__in=chunk_keys)
-            .only("key", "value", "version", "created_at", "updated_at")
-            .iterator(chunk_size=500)
-        }
-        refreshed_entries.update(chunk_refreshed)
-    
-    return [refreshed_entries[entry.key] for entry in all_results]
+    _invalidate(request_keys)
+    
+    # RETURNING order is not guaranteed, so restore the request order
+    return [upserted[key] for key in request_keys]
@@ -1,40 +1,194 @@
+import gzip
+import json
+from unittest import mock
+
+from django.core.cache import cache
 from django.urls import reverse
+from drf_spectacular.generators import SchemaGenerator
 from rest_framework import status
+from rest_framework import serializers as drf_serializers
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
+from storage import services
 from storage.models import KeyValueEntry
+from storage.renderers import ORJSONRenderer
+from storage.schemas import CachedSchemaGenerator
+from storage.serializers import (
+    BatchPutSerializer,
+    KeyValueSerializer,
+    validate_batch_items_fast,
+)
+from storage.services import batch_put, read_range, read_value
+
+# Resolve URLs once instead of walking the URLconf in every test
+KV_DETAIL = reverse("storage:kv-detail", args=["__K__"]).replace("__K__", "{}")
+KV_RANGE = reverse("storage:kv-range")
+KV_BATCH = reverse("storage:kv-batch")
 
 
 class KeyValueApiTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        services._local_entries.clear()
+
+    def _get_range(self, params):
+        response = self.client.get(KV_RANGE, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(b"".join(response.streaming_content))
+
     def test_put_and_read_key(self):
-        url = reverse("storage:kv-detail", args=["alpha"])
+        url = KV_DETAIL.format("alpha")
         response = self.client.put(url, {"value": "first"}, format="json")
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(response.data["value"], "first")
+        self.assertEqual(response.json()["value"], "first")
 
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data["key"], "alpha")
-        self.assertEqual(response.data["value"], "first")
+        self.assertEqual(response.json()["key"], "alpha")
+        self.assertEqual(response.json()["value"], "first")
+
+    def test_put_existing_key_increments_version(self):
+        url = KV_DETAIL.format("alpha")
+        self.client.put(url, {"value": "first"}, format="json")
+        response = self.client.put(url, {"value": "second"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["value"], "second")
+        self.assertEqual(response.json()["version"], 2)
+
+        response = self.client.get(url)
+        self.assertEqual(response.json()["value"], "second")
+
+    def test_read_matches_model_serializer_output(self):
+        entry = KeyValueEntry.objects.create(key="alpha", value="first")
+        url = KV_DETAIL.format("alpha")
+        response = self.client.get(url)
+        expected = json.loads(JSONRenderer().render(KeyValueSerializer(entry).data))
+        self.assertEqual(response.json(), expected)
+
+    def test_read_with_matching_etag_returns_304(self):
+        url = KV_DETAIL.format("alpha")
+        self.client.put(url, {"value": "first"}, format="json")
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+        self.client.put(url, {"value": "second"}, format="json")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
 
     def test_missing_key_returns_404(self):
-        url = reverse("storage:kv-detail", args=["missing"])
+        url = KV_DETAIL.format("missing")
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("detail", response.json())
 
     def test_range_query_returns_sorted_results(self):
         KeyValueEntry.objects.create(key="a", value="1")
         KeyValueEntry.objects.create(key="b", value="2")
         KeyValueEntry.objects.create(key="c", value="3")
 
-        url = reverse("storage:kv-range")
-        response = self.client.get(url, {"start": "a", "end": "b"})
+        data = self._get_range({"start": "a", "end": "b"})
+        self.assertEqual(data["count"], 2)
+        self.assertEqual([item["key"] for item in data["results"]], ["a", "b"])
+
+    def test_range_results_match_model_serializer_output(self):
+        entry = KeyValueEntry.objects.create(key="alpha", value="first")
+        data = self._get_range({"start": "alpha", "end": "beta"})
+        expected = json.loads(JSONRenderer().render(KeyValueSerializer(entry).data))
+        self.assertEqual(data["results"], [expected])
+
+    def test_range_query_paginates_with_cursor(self):
+        for key in ["a", "b", "c"]:
+            KeyValueEntry.objects.create(key=key, value=key)
+
+        data = self._get_range({"start": "a", "end": "c", "limit": 2})
+        self.assertEqual([item["key"] for item in data["results"]], ["a", "b"])
+        self.assertTrue(data["has_more"])
+        self.assertEqual(data["next_cursor"], "b")
+
+        data = self._get_range(
+            {"start": "a", "end": "c", "limit": 2, "cursor": data["next_cursor"]}
+        )
+        self.assertEqual([item["key"] for item in data["results"]], ["c"])
+        self.assertFalse(data["has_more"])
+        self.assertNotIn("next_cursor", data)
+
+    def test_range_query_rejects_non_positive_limit(self):
+        KeyValueEntry.objects.create(key="a", value="1")
+        for end in ["c", "a"]:
+            for limit in ["0", "-1", "abc"]:
+                with self.subTest(end=end, limit=limit):
+                    response = self.client.get(
+                        KV_RANGE, {"start": "a", "end": end, "limit": limit}
+                    )
+                    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_read_range_clamps_limit_to_one(self):
+        KeyValueEntry.objects.create(key="a", value="1")
+        KeyValueEntry.objects.create(key="b", value="2")
+        entries, next_cursor, has_more = read_range("a", "c", limit=0)
+        self.assertEqual([entry["key"] for entry in entries], ["a"])
+        self.assertEqual(next_cursor, "a")
+        self.assertTrue(has_more)
+
+    def test_range_query_streams_multiple_chunks(self):
+        for key in ["a", "b", "c"]:
+            KeyValueEntry.objects.create(key=key, value=key)
+
+        with mock.patch("storage.views.RANGE_CHUNK_SIZE", 2):
+            data = self._get_range({"start": "a", "end": "c"})
+        self.assertEqual(data["count"], 3)
+        self.assertEqual([item["key"] for item in data["results"]], ["a", "b", "c"])
+
+    def test_range_query_compressed_when_client_accepts_gzip(self):
+        KeyValueEntry.objects.create(key="a", value="1")
+        response = self.client.get(
+            KV_RANGE, {"start": "a", "end": "z"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        data = json.loads(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual([item["key"] for item in data["results"]], ["a"])
+
+    def test_single_key_range_served_by_point_read(self):
+        KeyValueEntry.objects.create(key="a", value="1")
+        KeyValueEntry.objects.create(key="ab", value="2")
+        self._get_range({"start": "a", "end": "a"})
+
+        # The first request cached the entry, so the repeat skips the database
+        with self.assertNumQueries(0):
+            data = self._get_range({"start": "a", "end": "a"})
+        self.assertEqual([item["key"] for item in data["results"]], ["a"])
+        self.assertEqual(data["count"], 1)
+        self.assertFalse(data["has_more"])
+
+        data = self._get_range({"start": "b", "end": "b"})
+        self.assertEqual(data, {"count": 0, "results": [], "has_more": False})
+
+    def test_range_query_empty_result(self):
+        data = self._get_range({"start": "x", "end": "z"})
+        self.assertEqual(data, {"count": 0, "results": [], "has_more": False})
+
+    def test_range_query_with_matching_etag_returns_304(self):
+        KeyValueEntry.objects.create(key="a", value="1")
+        KeyValueEntry.objects.create(key="b", value="2")
+        url = KV_RANGE
+        params = {"start": "a", "end": "c"}
+        etag = self.client.get(url, params)["ETag"]
+
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        KeyValueEntry.objects.filter(key="b").delete()
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data["count"], 2)
-        self.assertEqual([item["key"] for item in response.data["results"]], ["a", "b"])
 
     def test_batch_put_upserts_all_items(self):
-        url = reverse("storage:kv-batch")
+        url = KV_BATCH
         payload = {
             "items": [
                 {"key": "alpha", "value": "1"},
@@ -43,14 +197,194 @@ class KeyValueApiTests(APITestCase):
         }
         response = self.client.post(url, payload, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.json()), 2)
         self.assertTrue(KeyValueEntry.objects.filter(key="alpha").exists())
 
+    def test_batch_put_rejects_duplicate_keys(self):
+        url = KV_BATCH
+        payload = {
+            "items": [
+                {"key": "alpha", "value": "1"},
+                {"key": "alpha", "value": "2"},
+            ]
+        }
+        response = self.client.post(url, payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("'alpha'", str(response.data["items"]))
+        self.assertFalse(KeyValueEntry.objects.filter(key="alpha").exists())
+
     def test_delete_removes_key(self):
         KeyValueEntry.objects.create(key="temp", value="old")
-        url = reverse("storage:kv-detail", args=["temp"])
+        url = KV_DETAIL.format("temp")
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_missing_key_returns_404(self):
+        response = self.client.delete(KV_DETAIL.format("missing"))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_evicts_cached_entry(self):
+        KeyValueEntry.objects.create(key="temp", value="old")
+        read_value("temp")
+        self.assertIn("temp", services._local_entries)
+
+        response = self.client.delete(KV_DETAIL.format("temp"))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn("temp", services._local_entries)
+        self.assertIsNone(cache.get(services._get_cache_key("temp")))
+        with self.assertRaises(KeyValueEntry.DoesNotExist):
+            read_value("temp")
+
+    def test_batch_put_updates_existing_keys(self):
+        existing = KeyValueEntry.objects.create(key="alpha", value="old")
+        url = KV_BATCH
+        payload = {
+            "items": [
+                {"key": "alpha", "value": "new"},
+                {"key": "beta", "value": "2"},
+            ]
+        }
+        response = self.client.post(url, payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = {item["key"]: item for item in response.json()}
+        self.assertEqual(results["alpha"]["value"], "new")
+        self.assertEqual(results["alpha"]["version"], 2)
+        self.assertEqual(results["beta"]["version"], 1)
+
+        stored = KeyValueEntry.objects.get(key="alpha")
+        self.assertEqual(stored.value, "new")
+        self.assertEqual(stored.version, 2)
+        self.assertEqual(stored.created_at, existing.created_at)
+
+
+class ReadValueTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        services._local_entries.clear()
+
+    def test_local_copy_served_while_version_token_matches(self):
+        KeyValueEntry.objects.create(key="alpha", value="first")
+        read_value("alpha")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(read_value("alpha").value, "first")
+
+    def test_large_values_not_kept_locally(self):
+        KeyValueEntry.objects.create(key="small", value="v")
+        KeyValueEntry.objects.create(
+            key="large", value="v" * (services.LOCAL_CACHE_MAX_VALUE_LENGTH + 1)
+        )
+        read_value("small")
+        read_value("large")
+        self.assertEqual(list(services._local_entries), ["small"])
+
+    def test_local_copy_revalidated_after_shared_cache_changes(self):
+        KeyValueEntry.objects.create(key="alpha", value="first")
+        read_value("alpha")
+
+        # A write from another process updates the row and drops the shared
+        # cache entries, but cannot reach this process's local copy
+        KeyValueEntry.objects.filter(key="alpha").update(value="second", version=2)
+        cache.clear()
+
+        self.assertEqual(read_value("alpha").value, "second")
+
+
+class BatchValidationTests(APITestCase):
+    def test_fast_path_accepts_well_formed_batches(self):
+        payloads = [
+            {"items": [{"key": "alpha", "value": "1"}, {"key": "beta", "value": ""}]},
+            {"items": [{"key": " padded ", "value": "  spaced  ", "extra": True}]},
+            {"items": [{"key": "ключ", "value": "значение"}]},
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                serializer = BatchPutSerializer(data=payload)
+                self.assertTrue(serializer.is_valid())
+                self.assertEqual(
+                    validate_batch_items_fast(payload),
+                    [dict(item) for item in serializer.validated_data["items"]],
+                )
+
+    def test_fast_path_defers_unusual_input_to_serializer(self):
+        payloads = [
+            {"items": [{"key": "a", "value": "1"}, {"key": " a", "value": "2"}]},
+            {"items": [{"key": "k" * 256, "value": "1"}]},
+            {"items": [{"key": "   ", "value": "1"}]},
+            {"items": [{"key": "nul\x00", "value": "1"}]},
+            {"items": [{"key": "a", "value": "\ud800"}]},
+            {"items": [{"key": 1, "value": "1"}]},
+            {"items": [{"key": "a"}]},
+            {"items": []},
+            {"items": "not-a-list"},
+            [],
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                self.assertIsNone(validate_batch_items_fast(payload))
+
+
+class BatchPutServiceTests(APITestCase):
+    def test_results_follow_request_order(self):
+        entries = batch_put([{"key": "b", "value": "2"}, {"key": "a", "value": "1"}])
+        self.assertEqual([entry.key for entry in entries], ["b", "a"])
+
+    def test_list_batches_are_written_in_global_key_order(self):
+        items = [{"key": key, "value": key} for key in ["d", "b", "c", "a"]]
+        with mock.patch("storage.services.BATCH_CHUNK_SIZE", 2), mock.patch(
+            "storage.services._upsert", wraps=services._upsert
+        ) as upsert:
+            entries = batch_put(items)
+        chunks = [[key for key, _ in call.args[0]] for call in upsert.call_args_list]
+        self.assertEqual(chunks, [["a", "b"], ["c", "d"]])
+        self.assertEqual([entry.key for entry in entries], ["d", "b", "c", "a"])
+
+    def test_oversized_stream_rolls_back_written_chunks(self):
+        items = ({"key": f"k{i}", "value": str(i)} for i in range(5))
+        with mock.patch("storage.services.BATCH_CHUNK_SIZE", 2), mock.patch(
+            "storage.services.MAX_BATCH_SIZE", 3
+        ):
+            with self.assertRaises(ValueError):
+                batch_put(items)
+        self.assertFalse(KeyValueEntry.objects.exists())
+
+
+class ORJSONRendererTests(APITestCase):
+    def _assert_matches_json_renderer(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_list_field_errors_render_like_json_renderer(self):
+        serializer = drf_serializers.Serializer(data={"tags": ["ok", ""]})
+        serializer.fields["tags"] = drf_serializers.ListField(child=drf_serializers.CharField())
+        self.assertFalse(serializer.is_valid())
+        self._assert_matches_json_renderer(serializer.errors)
+
+    def test_line_separators_are_escaped(self):
+        self._assert_matches_json_renderer({"value": "a\u2028b\u2029c"})
+
+
+class SchemaViewTests(APITestCase):
+    def setUp(self):
+        CachedSchemaGenerator._schemas.clear()
+
+    def test_schema_generated_once_per_process(self):
+        url = reverse("schema")
+        with mock.patch.object(
+            SchemaGenerator, "get_schema", autospec=True, side_effect=SchemaGenerator.get_schema
+        ) as get_schema:
+            first = self.client.get(url)
+            second = self.client.get(url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(get_schema.call_count, 1)
+
+    def test_unknown_versions_and_languages_are_not_cached(self):
+        url = reverse("schema")
+        for params in [{"version": "bogus"}, {"lang": "xx-bogus"}]:
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(CachedSchemaGenerator._schemas, {})
@@ -1,4 +1,8 @@
-from django.http import Http404
+import hashlib
+
+import orjson
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
@@ -6,13 +10,82 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from storage.models import KeyValueEntry
+from storage.renderers import dumps
 from storage.serializers import (
     BatchPutSerializer,
     KeyValueRangeResponseSerializer,
     KeyValueSerializer,
     KeyValueWriteSerializer,
+    serialize_entry,
+    validate_batch_items_fast,
+)
+from storage.services import (
+    RANGE_CHUNK_SIZE,
+    batch_put,
+    delete_value,
+    put_value,
+    read_range,
+    read_value,
 )
-from storage.services import batch_put, delete_value, put_value, read_range, read_value
+
+
+def _json_response(data, status_code: int = status.HTTP_200_OK) -> HttpResponse:
+    """Encode with orjson directly, bypassing DRF's renderer for hot paths."""
+    return HttpResponse(
+        dumps(data),
+        content_type="application/json",
+        status=status_code,
+    )
+
+
+def _entry_etag(entry) -> str:
+    """Weak ETag for a single entry; updated_at distinguishes a re-created key at version 1."""
+    return f'W/"{entry.version}-{int(entry.updated_at.timestamp() * 1_000_000)}"'
+
+
+def _range_etag(entries, has_more: bool) -> str:
+    """Weak ETag for a range page, hashed from each entry's key, version and updated_at."""
+    fingerprint = orjson.dumps(
+        [(entry["key"], entry["version"], entry["updated_at"]) for entry in entries]
+    )
+    digest = hashlib.blake2b(fingerprint, digest_size=16)
+    digest.update(b"+" if has_more else b"-")
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _conditional_response(request, etag: str, build_response):
+    """
+    Answer with 304 Not Modified when If-None-Match matches etag, skipping
+    serialization entirely; otherwise build the full response. Both carry the
+    validators so clients can revalidate on their next request.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = build_response()
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def _stream_range(entries, next_cursor, has_more):
+    """
+    Yield the range response body piece by piece, encoding RANGE_CHUNK_SIZE
+    entries per orjson call so the full results list and response body are
+    never held in memory at once.
+    """
+    yield b'{"count":%d,"results":[' % len(entries)
+    for start in range(0, len(entries), RANGE_CHUNK_SIZE):
+        # Entries are already serialize_entry()-shaped dicts from values().
+        # Strip the list brackets so consecutive chunks join into one array
+        chunk = entries[start : start + RANGE_CHUNK_SIZE]
+        encoded = dumps(chunk)[1:-1]
+        yield b"," + encoded if start else encoded
+    
+    tail = {"has_more": has_more}
+    if next_cursor:
+        tail["next_cursor"] = next_cursor
+    # Splice the pagination fields in after the results array
+    yield b"]," + dumps(tail)[1:]
 
 
 class KeyValueView(APIView):
@@ -41,13 +114,16 @@ class KeyValueView(APIView):
                 response=KeyValueSerializer,
                 description="Successfully retrieved the key/value pair",
             ),
+            304: OpenApiResponse(description="Not modified: If-None-Match matched the current ETag"),
             404: OpenApiResponse(description="Key not found"),
         },
         tags=["Key-Value Operations"],
     )
     def get(self, request, key: str):
         entry = self._get_entry(key)
-        return Response(KeyValueSerializer(entry).data)
+        return _conditional_response(
+            request, _entry_etag(entry), lambda: _json_response(serialize_entry(entry))
+        )
 
     @extend_schema(
         operation_id="put_key",
@@ -79,7 +155,7 @@ class KeyValueView(APIView):
         serializer.is_valid(raise_exception=True)
         entry, created = put_value(key, serializer.validated_data["value"])
         status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-        return Response(KeyValueSerializer(entry).data, status=status_code)
+        return _json_response(serialize_entry(entry), status_code)
 
     @extend_schema(
         operation_id="delete_key",
@@ -109,6 +185,12 @@ class KeyValueView(APIView):
 class KeyValueRangeView(APIView):
     """Return values whose keys fall within the provided inclusive range."""
 
+    def _point_range(self, key: str):
+        try:
+            return [serialize_entry(read_value(key))]
+        except KeyValueEntry.DoesNotExist:
+            return []
+
     @extend_schema(
         operation_id="read_key_range",
         summary="Read key/value pairs in a range",
@@ -132,7 +214,7 @@ class KeyValueRangeView(APIView):
                 name="limit",
                 type=int,
                 location=OpenApiParameter.QUERY,
-                description="Maximum number of results to return (default: 10000, max: 10000)",
+                description="Maximum number of results to return (1-10000, default: 10000)",
                 required=False,
             ),
             OpenApiParameter(
@@ -148,6 +230,7 @@ class KeyValueRangeView(APIView):
                 response=KeyValueRangeResponseSerializer,
                 description="Successfully retrieved key/value pairs in the range",
             ),
+            304: OpenApiResponse(description="Not modified: If-None-Match matched the current ETag"),
             400: OpenApiResponse(description="Invalid range parameters"),
         },
         tags=["Key-Value Operations"],
@@ -168,26 +251,40 @@ class KeyValueRangeView(APIView):
         
         # Parse pagination parameters
         limit = request.query_params.get("limit")
-        limit = int(limit) if limit else None
+        if limit:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                return Response(
+                    {"detail": "limit must be a positive integer"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        else:
+            limit = None
         
         cursor = request.query_params.get("cursor")
         
-        # Use memory-efficient range query with pagination
-        entries, next_cursor, has_more = read_range(
-            start_key, end_key, limit=limit, cursor=cursor
-        )
-        
-        serializer = KeyValueSerializer(entries, many=True)
-        response_data = {
-            "count": len(serializer.data),
-            "results": serializer.data,
-            "has_more": has_more,
-        }
-        
-        if next_cursor:
-            response_data["next_cursor"] = next_cursor
+        if start_key == end_key and not cursor:
+            # A single-key range is a point lookup: serve it through read_value's
+            # cache tiers instead of setting up a range scan
+            entries, next_cursor, has_more = self._point_range(start_key), None, False
+        else:
+            # Use memory-efficient range query with pagination
+            entries, next_cursor, has_more = read_range(
+                start_key, end_key, limit=limit, cursor=cursor
+            )
         
-        return Response(response_data)
+        # Stream the body so clients get the first bytes before the whole page is encoded
+        return _conditional_response(
+            request,
+            _range_etag(entries, has_more),
+            lambda: StreamingHttpResponse(
+                _stream_range(entries, next_cursor, has_more),
+                content_type="application/json",
+            ),
+        )
 
 
 class BatchPutView(APIView):
@@ -208,15 +305,18 @@ class BatchPutView(APIView):
         tags=["Key-Value Operations"],
     )
     def post(self, request):
-        serializer = BatchPutSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        # Well-formed batches skip DRF's per-item field validation; anything
+        # else goes through the serializer for standard error reporting
+        items = validate_batch_items_fast(request.data)
+        if items is None:
+            serializer = BatchPutSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            items = serializer.validated_data["items"]
         
         try:
-            entries = batch_put(serializer.validated_data["items"])
+            entries = batch_put(items)
         except ValueError as e:
             # Handle batch size limit errors
             raise ValidationError({"detail": str(e)})
         
-        return Response(
-            KeyValueSerializer(entries, many=True).data, status=status.HTTP_200_OK
-        )
+        return _json_response([serialize_entry(entry) for entry in entries])